@@ -1,14 +1,21 @@
 import gradio as gr
-from llama_index.core import VectorStoreIndex, Settings
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from llama_index.core import VectorStoreIndex, Settings, QueryBundle
+from llama_index.core.postprocessor import SimilarityPostprocessor
+from typing import Optional, List, Dict, Tuple
 from pathlib import Path
-import json
+from functools import lru_cache
+from dataclasses import dataclass
+import asyncio
+import hashlib
+import re
 import subprocess
+import threading
 import os
+import numpy as np
+import orjson
 import spaces
 
-from indexing import ServiceConfig, setup_settings, load_or_create_index
+from indexing import ServiceConfig, configure_logging, setup_settings, load_or_create_index, load_topic_seed_ids, get_storage_mtime, decode_embedding, TOPIC_SEED_QUERY, DEFAULT_RETRIEVAL_CONFIG
 
 # Configure your model here
 MODEL_CONFIG = ServiceConfig(
@@ -18,129 +25,299 @@ MODEL_CONFIG = ServiceConfig(
 )
 from prompts import DOCUMENT_TOPICS_ANALYSIS_PROMPT, CHATBOT_RESPONSE_PROMPT, CHATBOT_TOPIC_RESPONSE_PROMPT
 
+@lru_cache(maxsize=1)
 def load_config(config_path: str = "config.json") -> dict:
-    """Load configuration from JSON file."""
+    """Load configuration from JSON file (parsed once per process)."""
     try:
-        with open(config_path, 'r') as f:
-            return json.load(f)
+        return orjson.loads(Path(config_path).read_bytes())
     except FileNotFoundError:
         print(f"Config file {config_path} not found. Using defaults.")
         return {
             "person": {"name": "Assistant", "docs_directory": "docs"},
             "chatbot": {"title": "Younger Me Chatbot", "description": "Chat with your younger self"},
-            "retrieval": {"similarity_threshold": 0.7, "max_chunks": 5, "context_history_length": 3}
+            "retrieval": dict(DEFAULT_RETRIEVAL_CONFIG)
         }
 
+def _get_index(docs_directory: str) -> VectorStoreIndex:
+    """Get the shared index; load_or_create_index reloads it once storage changes or the cache expires."""
+    return load_or_create_index(docs_directory=docs_directory, config=MODEL_CONFIG)
+
+# Emoji mapping for common topics
+TOPIC_EMOJIS = {
+    "gaming": "🎮", "technology": "💻", "tech": "💻", "coding": "💻", "programming": "💻",
+    "music": "🎵", "concerts": "🎤", "songs": "🎵", "bands": "🎸",
+    "career": "💼", "work": "💼", "job": "💼", "professional": "💼",
+    "travel": "✈️", "adventures": "🗺️", "trips": "🧳", "places": "🌍",
+    "relationships": "💝", "friends": "👥", "social": "🤝", "people": "👥",
+    "school": "🎓", "education": "📚", "learning": "📖", "college": "🎓",
+    "sports": "⚽", "fitness": "💪", "health": "🏃", "exercise": "💪",
+    "food": "🍕", "cooking": "👨‍🍳", "eating": "🍽️", "restaurants": "🍴",
+    "hobbies": "🎨", "creative": "🎨", "projects": "🛠️", "making": "🔨",
+    "family": "👨‍👩‍👧‍👦", "personal": "🧠", "growth": "🌱", "thoughts": "💭",
+    "experiences": "⭐", "memories": "📸", "stories": "📖", "life": "🌟"
+}
+
+def build_keyword_pattern(keywords) -> str:
+    """Build a regex alternation over keywords factored into a prefix trie.
+
+    The regex engine then walks shared prefixes once per start position
+    (like an Aho-Corasick goto function) instead of retrying every keyword.
+    The longest keyword along a path wins, so the match is always a full key.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def render(node: dict) -> str:
+        branches = [re.escape(char) + render(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{pattern})?" if "" in node else pattern
+
+    return render(trie)
+
+
+# Keywords compiled once into a trie-shaped regex so each topic is scanned once in C
+_TOPIC_RE = re.compile(build_keyword_pattern(TOPIC_EMOJIS))
+_WORD_RE = re.compile(r"[a-z]+")
+
+
+def get_topic_emoji(word: str) -> str:
+    """Pick an emoji for an already-lowercased topic word, falling back to a generic target."""
+    # Most topics are whole keywords, which one dict lookup per token settles
+    for token in _WORD_RE.findall(word):
+        emoji = TOPIC_EMOJIS.get(token)
+        if emoji is not None:
+            return emoji
+    # Keywords inside longer words ("homework", "technological") need the substring scan
+    match = _TOPIC_RE.search(word)
+    return TOPIC_EMOJIS[match.group(0)] if match else "🎯"
+
+
+TOPICS_CACHE_FILENAME = "topics_cache.json"
+
+
+def get_index_fingerprint(index: VectorStoreIndex, storage_directory: str = "./storage") -> str:
+    """Fingerprint the indexed documents so cached results are invalidated on reindex."""
+    storage_mtime = get_storage_mtime(storage_directory)
+    doc_ids = "|".join(sorted(index.docstore.docs.keys()))
+    return hashlib.sha1((doc_ids + str(storage_mtime)).encode()).hexdigest()
+
+
+def load_cached_topics(cache_path: Path, fingerprint: str) -> Optional[List[dict]]:
+    """Return cached topics if they were generated for the same index."""
+    try:
+        cached = orjson.loads(cache_path.read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+    if cached.get("fingerprint") == fingerprint:
+        return cached.get("topics")
+    return None
+
+
+def save_cached_topics(cache_path: Path, fingerprint: str, topics: List[dict]) -> None:
+    """Persist generated topics next to the index they were generated from."""
+    try:
+        cache_path.write_bytes(orjson.dumps({"fingerprint": fingerprint, "topics": topics}, option=orjson.OPT_INDENT_2))
+    except OSError as e:
+        print(f"Could not write topics cache: {e}")
+
+
+def get_document_topics(index: VectorStoreIndex, config: dict, storage_directory: str = "./storage") -> List[dict]:
+    """Return the document topics, reusing the on-disk cache when the index is unchanged."""
+    cache_path = Path(storage_directory) / TOPICS_CACHE_FILENAME
+    fingerprint = get_index_fingerprint(index, storage_directory)
+
+    topics = load_cached_topics(cache_path, fingerprint)
+    # An empty list cached before empty replies were rejected counts as a miss
+    if topics:
+        print(f"Loaded {len(topics)} topics from {cache_path}")
+        return topics
+
+    topics = generate_document_topics(index, config, storage_directory)
+    if topics is not None:
+        save_cached_topics(cache_path, fingerprint, topics)
+        return topics
+
+    return [
+        {"word": "Gaming", "emoji": "🎮"},
+        {"word": "Music", "emoji": "🎵"},
+        {"word": "Career", "emoji": "💼"},
+        {"word": "Travel", "emoji": "✈️"},
+        {"word": "Friends", "emoji": "👥"},
+        {"word": "Hobbies", "emoji": "🎨"}
+    ]
+
+
 @spaces.GPU
-def get_document_topics(index: VectorStoreIndex, config: dict) -> List[dict]:
+def generate_document_topics(index: VectorStoreIndex, config: dict, storage_directory: str = "./storage") -> Optional[List[dict]]:
     """Analyze the indexed documents to identify key life areas/topics."""
     
-    # Emoji mapping for common topics
-    topic_emojis = {
-        "gaming": "🎮", "technology": "💻", "tech": "💻", "coding": "💻", "programming": "💻",
-        "music": "🎵", "concerts": "🎤", "songs": "🎵", "bands": "🎸",
-        "career": "💼", "work": "💼", "job": "💼", "professional": "💼",
-        "travel": "✈️", "adventures": "🗺️", "trips": "🧳", "places": "🌍",
-        "relationships": "💝", "friends": "👥", "social": "🤝", "people": "👥",
-        "school": "🎓", "education": "📚", "learning": "📖", "college": "🎓",
-        "sports": "⚽", "fitness": "💪", "health": "🏃", "exercise": "💪",
-        "food": "🍕", "cooking": "👨‍🍳", "eating": "🍽️", "restaurants": "🍴",
-        "hobbies": "🎨", "creative": "🎨", "projects": "🛠️", "making": "🔨",
-        "family": "👨‍👩‍👧‍👦", "personal": "🧠", "growth": "🌱", "thoughts": "💭",
-        "experiences": "⭐", "memories": "📸", "stories": "📖", "life": "🌟"
-    }
-    
     try:
-        # Get a sample of documents to analyze for topics
-        retriever = index.as_retriever(similarity_top_k=10)
-        sample_nodes = retriever.retrieve("life experiences interests work relationships music travel school")
+        # Get a sample of documents to analyze for topics, precomputed at index time if available
+        seed_ids = load_topic_seed_ids(storage_directory) or []
+        sample_nodes = [index.docstore.get_node(node_id, raise_error=False) for node_id in seed_ids]
+        # Seed ids left over from an earlier index may name nodes that no longer exist
+        if not sample_nodes or any(node is None for node in sample_nodes):
+            retriever = index.as_retriever(similarity_top_k=10)
+            sample_nodes = retriever.retrieve(TOPIC_SEED_QUERY)
         
         # Combine content from various documents
         sample_content = "\n\n".join([node.text[:500] for node in sample_nodes[:5]])
         
-        from llama_index.core import Settings
         llm = Settings.llm
         
         prompt = DOCUMENT_TOPICS_ANALYSIS_PROMPT.format(content=sample_content)
 
         response = llm.complete(prompt)
-        topic_words = [line.strip().lower() for line in response.text.split('\n') if line.strip() and not line.strip().startswith('#')]
+        # A failed generation comes back as an "Error: ..." reply, not an exception
+        if response.additional_kwargs.get("error") or response.text.startswith("Error:"):
+            print(f"Error generating topics: {response.text}")
+            return None
+        lines = (line.strip() for line in response.text.split('\n'))
+        # Keep the original casing for display and the lowercase form for matching
+        topic_words = [(line, line.lower()) for line in lines if line and not line.startswith('#')]
         
         # Create topic objects with emojis
         topics = []
-        for word in topic_words[:8]:
-            # Find appropriate emoji
-            emoji = "🎯"  # default
-            for key, emj in topic_emojis.items():
-                if key in word.lower():
-                    emoji = emj
-                    break
-            
+        for original, word in topic_words[:8]:
             topics.append({
-                "word": word.capitalize(),
-                "emoji": emoji
+                "word": original[:1].upper() + original[1:],
+                "emoji": get_topic_emoji(word)
             })
         
-        return topics
+        # None rather than [] so an empty reply is not cached as the topic list
+        return topics or None
     except Exception as e:
         print(f"Error generating topics: {e}")
-        return [
-            {"word": "Gaming", "emoji": "🎮"},
-            {"word": "Music", "emoji": "🎵"},
-            {"word": "Career", "emoji": "💼"},
-            {"word": "Travel", "emoji": "✈️"},
-            {"word": "Friends", "emoji": "👥"},
-            {"word": "Hobbies", "emoji": "🎨"}
-        ]
+        return None
+
+
+
+# Per-query chunk logging is only worth its formatting cost when debugging
+LOG_RETRIEVAL = os.environ.get("LOG_LEVEL") is not None
+
+RESPONSE_CACHE_SIZE = 128
+SEMANTIC_CACHE_THRESHOLD = 0.95
+
+# Exact question -> response, evicted in insertion order
+# The prompt is built from the question and its retrieved chunks only, so the
+# conversation history does not change the response and is not part of the key
+_exact_cache: Dict[str, str] = {}
+# (normalized query embedding, question, response) for near-duplicate questions
+_sem_cache: List[Tuple[np.ndarray, str, str]] = []
+# Gradio runs handlers on several threads at once
+_cache_lock = threading.Lock()
+
+
+def get_exact_cache_hit(question: str) -> Optional[str]:
+    """Return the cached response for exactly this question, if any."""
+    with _cache_lock:
+        return _exact_cache.get(question)
+
+
+def get_semantic_cache_hit(query_embedding: np.ndarray) -> Optional[str]:
+    """Return the cached response of the most similar earlier question, if close enough."""
+    with _cache_lock:
+        if not _sem_cache:
+            return None
+        similarities = np.dot(np.stack([entry[0] for entry in _sem_cache]), query_embedding)
+        best = int(np.argmax(similarities))
+        if similarities[best] < SEMANTIC_CACHE_THRESHOLD:
+            return None
+        question, response = _sem_cache[best][1:]
+    print(f"Semantic cache hit ({similarities[best]:.3f}): {question}")
+    return response
+
+
+def cache_response(question: str, query_embedding: np.ndarray, response: str) -> None:
+    """Store a response in both the exact and the semantic cache."""
+    with _cache_lock:
+        if question not in _exact_cache and len(_exact_cache) >= RESPONSE_CACHE_SIZE:
+            _exact_cache.pop(next(iter(_exact_cache)))
+        _exact_cache[question] = response
+
+        _sem_cache.append((query_embedding, question, response))
+        if len(_sem_cache) > RESPONSE_CACHE_SIZE:
+            _sem_cache.pop(0)
+
 
+def get_example_embedding(question: str, config: dict) -> Optional[np.ndarray]:
+    """Return the embedding stored at index time if question is one of the example questions."""
+    example_embeddings = config.get("chatbot", {}).get("example_embeddings")
+    # Keyed by question text, so reordered or edited examples can't pick up another's vector
+    if not isinstance(example_embeddings, dict) or question not in example_embeddings:
+        return None
+    return decode_embedding(example_embeddings[question])
 
 
 @spaces.GPU
 def chatbot(input_text, history, index: Optional[VectorStoreIndex] = None, config: dict = None):
+    """Yield the response to input_text piece by piece as the LLM generates it."""
     try:
         chatbot_input = ChatbotInput(text=input_text)
-        
+
         # Load config with defaults
-        if config is None:
-            config = load_config()
-        
-        if index is None:
-            index = load_or_create_index(docs_directory=config["person"]["docs_directory"])
-            
+        config = config or load_config()
+
         # Use retrieval config settings
         retrieval_config = config.get("retrieval", {})
-        max_chunks = retrieval_config.get("max_chunks", 5)
-        similarity_threshold = retrieval_config.get("similarity_threshold", 0.7)
+        max_chunks = retrieval_config.get("max_chunks", DEFAULT_RETRIEVAL_CONFIG["max_chunks"])
+        similarity_threshold = retrieval_config.get("similarity_threshold", DEFAULT_RETRIEVAL_CONFIG["similarity_threshold"])
+
+        # Topic buttons and repeated questions send identical prompts
+        cached = get_exact_cache_hit(chatbot_input.text)
+        if cached is not None:
+            yield cached
+            return
+
+        index = index or _get_index(config["person"]["docs_directory"])
         
+        # Embed the question once for both the semantic cache and retrieval
+        query_embedding = get_example_embedding(chatbot_input.text, config)
+        if query_embedding is None:
+            query_embedding = np.asarray(Settings.embed_model.get_query_embedding(chatbot_input.text), dtype=np.float32)
+        query_embedding /= np.linalg.norm(query_embedding) or 1.0
+
+        cached = get_semantic_cache_hit(query_embedding)
+        if cached is not None:
+            yield cached
+            return
+
         # Use retriever to get top chunks and filter by score
         retriever = index.as_retriever(similarity_top_k=max_chunks)
-        nodes = retriever.retrieve(chatbot_input.text)
+        nodes = retriever.retrieve(QueryBundle(query_str=chatbot_input.text, embedding=query_embedding.tolist()))
 
         # Filter chunks with high similarity scores
-        high_score_nodes = [node for node in nodes if node.score >= similarity_threshold]
+        high_score_nodes = SimilarityPostprocessor(similarity_cutoff=similarity_threshold).postprocess_nodes(nodes)
         
         # If no high-scoring nodes, use the top one anyway
-        if not high_score_nodes and nodes:
-            high_score_nodes = [nodes[0]]
+        if not high_score_nodes:
+            high_score_nodes = nodes[:1]
 
         # Log the matched chunks
-        print(f"\n=== Query: {input_text} ===")
-        print(f"Found {len(nodes)} total chunks, {len(high_score_nodes)} with score >= 0.7:")
-        for i, node in enumerate(high_score_nodes):
-            print(f"\nChunk {i+1} (Score: {node.score:.3f}):")
-            print(f"Content: {node.text[:200]}...")
-            if hasattr(node.node, 'metadata') and node.node.metadata:
-                print(f"Metadata: {node.node.metadata}")
-        print("=" * 50)
+        if LOG_RETRIEVAL:
+            print(f"\n=== Query: {input_text} ===")
+            print(f"Found {len(nodes)} total chunks, {len(high_score_nodes)} with score >= {similarity_threshold}:")
+            for i, node in enumerate(high_score_nodes):
+                print(f"\nChunk {i+1} (Score: {node.score:.3f}):")
+                print(f"Content: {node.text[:200]}...")
+                if hasattr(node.node, 'metadata') and node.node.metadata:
+                    print(f"Metadata: {node.node.metadata}")
+            print("=" * 50)
 
         if not high_score_nodes:
-            return "No matching content found."
+            yield "No matching content found."
+            return
 
         # Combine multiple high-scoring chunks as style reference
-        combined_content = "\n\n---\n\n".join([node.text for node in high_score_nodes])
+        combined_content = "\n\n---\n\n".join(node.text for node in high_score_nodes)
         
         # Use the LLM directly to process the content
-        from llama_index.core import Settings
         llm = Settings.llm
         
         # Build conversation context using config
@@ -153,51 +330,146 @@ def chatbot(input_text, history, index: Optional[VectorStoreIndex] = None, confi
             question=chatbot_input.text
         )
         
-        # Get complete response (non-streaming)
-        response = llm.complete(prompt)
-        return response.text
+        # Stream the response as it is generated
+        response_text = ""
+        failed = False
+        for chunk in llm.stream_complete(prompt):
+            delta = chunk.delta or ""
+            response_text += delta
+            # Generation can fail after part of the response was streamed
+            failed = failed or chunk.additional_kwargs.get("error", False)
+            yield delta
+        if response_text.strip() and not failed:
+            cache_response(chatbot_input.text, query_embedding, response_text)
     except Exception as e:
-        return f"Error: {str(e)}"
+        yield f"Error: {str(e)}"
 
 
 
-class ChatbotInput(BaseModel):
-    text: str = Field(..., min_length=1, max_length=10000)
-    directory_path: Optional[str] = Field(default="storage")
+@dataclass(slots=True, frozen=True)
+class ChatbotInput:
+    text: str
+    directory_path: Optional[str] = "storage"
+
+    def __post_init__(self):
+        if not 1 <= len(self.text) <= 10000:
+            raise ValueError("text must be between 1 and 10000 characters")
 
 
 # Legacy function for backward compatibility - now handled by setup_settings
 pass
 
 
+# Horizontally scrolling topic buttons and an auto-height chat window
+CHATBOT_CSS = """
+.scroll-buttons {
+    display: flex !important;
+    flex-direction: row !important;
+    overflow-x: auto !important;
+    overflow-y: hidden !important;
+    gap: 8px !important;
+    padding: 8px 0 !important;
+    scrollbar-width: thin !important;
+    flex-wrap: nowrap !important;
+    width: 100% !important;
+}
+.scroll-buttons::-webkit-scrollbar {
+    height: 6px;
+}
+.scroll-buttons::-webkit-scrollbar-track {
+    background: #f1f1f1;
+    border-radius: 4px;
+}
+.scroll-buttons::-webkit-scrollbar-thumb {
+    background: #888;
+    border-radius: 4px;
+}
+.scroll-buttons button {
+    flex-shrink: 0 !important;
+    flex-grow: 0 !important;
+    white-space: nowrap !important;
+    margin-right: 8px !important;
+    min-width: 140px !important;
+    max-width: 140px !important;
+    height: 40px !important;
+    font-size: 13px !important;
+    overflow: hidden !important;
+    text-overflow: ellipsis !important;
+}
+.chatbot {
+    min-height: 200px !important;
+    max-height: none !important;
+    height: auto !important;
+}
+"""
+
+
+@spaces.GPU
+def warm_up_llm() -> None:
+    """Run a one-token generation so the first user turn only pays for its own generation."""
+    Settings.llm.complete("ready", max_new_tokens=1)
+
+
+def wait_for_startup_script(process: Optional[subprocess.Popen]) -> None:
+    """Wait for the startup script launched in main() and report how it exited."""
+    if process is None:
+        return
+    returncode = process.wait()
+    if returncode == 0:
+        print("✅ Startup script completed successfully")
+    else:
+        print(f"⚠️  Startup script exited with code {returncode}")
+
+
+def load_llm() -> None:
+    """Load the LLM weights ahead of the first request, if the LLM supports it."""
+    load = getattr(Settings.llm, "load", None)
+    if load is None:
+        return
+    try:
+        load()
+    except Exception as e:
+        # Generation loads the model again on first use, so report and carry on
+        print(f"⚠️  Could not preload the model: {e}")
+
+
+async def load_index_and_model(startup_process: Optional[subprocess.Popen]) -> Tuple[dict, VectorStoreIndex]:
+    """Load the config and index while the LLM weights are loaded in the background."""
+    # A daemon thread rather than to_thread: asyncio.run would wait for the
+    # weights before reporting an index error, and a daemon does not hold up exit
+    llm_loader = threading.Thread(target=load_llm, daemon=True)
+    llm_loader.start()
+
+    # The startup script may still be copying the sample config and storage
+    await asyncio.to_thread(wait_for_startup_script, startup_process)
+    config = load_config()
+    index = await asyncio.to_thread(_get_index, config["person"]["docs_directory"])
+
+    await asyncio.to_thread(llm_loader.join)
+    return config, index
+
+
 def main():
     """Main function to launch the chatbot interface."""
-    # Run startup script to ensure storage directory is properly set up
+    configure_logging()
+
+    # Start the startup script to ensure storage directory is properly set up
     print("Running startup script to check storage setup...")
+    startup_process = None
     try:
         startup_script_path = os.path.join(os.path.dirname(__file__), "startup.sh")
-        result = subprocess.run([startup_script_path], capture_output=True, text=True)
-        if result.returncode == 0:
-            print("✅ Startup script completed successfully")
-            if result.stdout:
-                print(result.stdout.strip())
-        else:
-            print(f"⚠️  Startup script exited with code {result.returncode}")
-            if result.stderr:
-                print(f"Error output: {result.stderr.strip()}")
+        # Output goes straight to our stdout/stderr as the script runs
+        startup_process = subprocess.Popen([startup_script_path])
     except Exception as e:
         print(f"⚠️  Could not run startup script: {e}")
         print("Continuing without startup script...")
 
-    # Load configuration
-    config = load_config()
-    
     # Load the index once at startup
     try:
         # Set up the model configuration before loading index
         setup_settings(MODEL_CONFIG)
 
-        index = load_or_create_index(docs_directory=config["person"]["docs_directory"])
+        config, index = asyncio.run(load_index_and_model(startup_process))
         print("Index loaded successfully!")
         print(f"Using model: {MODEL_CONFIG.model_name}")
         print(f"Temperature: {MODEL_CONFIG.temperature}")
@@ -206,6 +478,13 @@ def main():
         print(f"Error loading index: {e}")
         print("Please run 'python index_documents.py' first to create the vector database.")
         return
+
+    # Topics may come from cache, so nothing else is guaranteed to run the model before the UI
+    try:
+        warm_up_llm()
+    except Exception as e:
+        # The first request then pays for the warm-up instead
+        print(f"⚠️  Could not warm up the model: {e}")
     
     # Create a wrapper function that uses the loaded index and config
     def chatbot_with_index(message, history):
@@ -217,47 +496,7 @@ def main():
     # Get life topics from documents
     topics = get_document_topics(index, config)
     
-    with gr.Blocks(title=chatbot_config.get("title", "AI Chatbot"), css="""
-        .scroll-buttons {
-            display: flex !important;
-            flex-direction: row !important;
-            overflow-x: auto !important;
-            overflow-y: hidden !important;
-            gap: 8px !important;
-            padding: 8px 0 !important;
-            scrollbar-width: thin !important;
-            flex-wrap: nowrap !important;
-            width: 100% !important;
-        }
-        .scroll-buttons::-webkit-scrollbar {
-            height: 6px;
-        }
-        .scroll-buttons::-webkit-scrollbar-track {
-            background: #f1f1f1;
-            border-radius: 4px;
-        }
-        .scroll-buttons::-webkit-scrollbar-thumb {
-            background: #888;
-            border-radius: 4px;
-        }
-        .scroll-buttons button {
-            flex-shrink: 0 !important;
-            flex-grow: 0 !important;
-            white-space: nowrap !important;
-            margin-right: 8px !important;
-            min-width: 140px !important;
-            max-width: 140px !important;
-            height: 40px !important;
-            font-size: 13px !important;
-            overflow: hidden !important;
-            text-overflow: ellipsis !important;
-        }
-        .chatbot {
-            min-height: 200px !important;
-            max-height: none !important;
-            height: auto !important;
-        }
-    """) as iface:
+    with gr.Blocks(title=chatbot_config.get("title", "AI Chatbot"), css=CHATBOT_CSS) as iface:
         gr.Markdown(f"# {chatbot_config.get('title', 'AI Chatbot')}")
         # gr.Markdown(chatbot_config.get("description", "Chat with AI based on indexed documents."))
         
@@ -279,10 +518,12 @@ def main():
             history.append([message, "..."])
             yield history, ""
             
-            # Get complete response
-            response = chatbot_with_index(message, history[:-1])
-            history[-1] = [message, response]
-            yield history, ""
+            # Replace the loading dots with the response as it streams in
+            response = ""
+            for delta in chatbot_with_index(message, history[:-1]):
+                response += delta
+                history[-1] = [message, response]
+                yield history, ""
         
         def handle_topic_click(topic_word):
             return CHATBOT_TOPIC_RESPONSE_PROMPT.format(topic_word=topic_word)
@@ -7,7 +7,7 @@ Run this script to index documents before starting the chatbot.
 import os
 import sys
 
-from indexing import index_documents
+from indexing import index_documents, configure_logging
 
 def main():
     """Main entry point for the indexing script."""
@@ -40,6 +40,7 @@ def main():
     )
     
     args = parser.parse_args()
+    configure_logging()
     
     # Set API key if provided
     if args.api_key:
@@ -4,28 +4,60 @@ This module contains all the code needed to index documents and set up the Llama
 """
 
 import os
-import json
+import math
+import asyncio
+import hashlib
+import logging
+import re
 import shutil
+import tarfile
+import tempfile
+import time
+from threading import Thread
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, List
-from pydantic import BaseModel, Field, field_validator
+from typing import Optional, List, Tuple, Literal
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 
 from llama_index.core import SimpleDirectoryReader, VectorStoreIndex, Settings, StorageContext, load_index_from_storage
 from llama_index.core.llms import CustomLLM, CompletionResponse, CompletionResponseGen
 from llama_index.core.llms.callbacks import llm_completion_callback
+from llama_index.core.schema import MetadataMode
+from llama_index.core.vector_stores import SimpleVectorStore, VectorStoreQuery, VectorStoreQueryResult
+from llama_index.core.vector_stores.types import VectorStoreQueryMode
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.vector_stores.faiss import FaissVectorStore
 
+from prompts import CONFIG_ANALYSIS_PROMPT
+
+import faiss
+import numpy as np
+import orjson
 import torch
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from transformers import AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer, pipeline
 from typing import Any, List, Optional, Dict
 import spaces
 import os
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
 # Disable CUDA multiprocessing sharing to prevent CUDA context issues
 os.environ["CUDA_VISIBLE_DEVICES"] = "0"
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
 
+def configure_logging(level: int = logging.INFO) -> None:
+    """Send log records to stderr through a single handler, for command-line entry points."""
+    logging.basicConfig(format="%(message)s")
+    # Only this module is raised to level; libraries keep the root's WARNING threshold
+    logger.setLevel(level)
+
+
 def get_device() -> str:
     """Get the best available device for PyTorch operations."""
     if torch.cuda.is_available():
@@ -43,6 +75,14 @@ class ServiceConfig(BaseModel):
     max_input_size: int = Field(default=4096, ge=1)
     temperature: float = Field(default=0.7, ge=0.0, le=2.0)
     model_name: str = Field(default="mistralai/Mistral-7B-Instruct-v0.1")
+    index_type: Literal["flat", "hnsw", "ivfpq"] = Field(default="hnsw")
+    hnsw_m: int = Field(default=32, ge=4, le=128)
+    hnsw_ef_construction: int = Field(default=100, ge=1)
+    hnsw_ef_search: int = Field(default=64, ge=1)
+    embed_batch_size: int = Field(default=128, ge=1, le=2048)
+    embed_workers: int = Field(default=1, ge=1, le=32)
+    storage_format: Literal["directory", "tar"] = Field(default="directory")
+    quantization: Literal["none", "sq8", "fp16"] = Field(default="sq8")
 
     @field_validator('max_input_size')
     @classmethod
@@ -91,7 +131,7 @@ class HuggingFaceLLM(CustomLLM):
     def _load_model(self):
         """Load the model and tokenizer if not already loaded."""
         if self.model is None or self.tokenizer is None:
-            print(f"Loading model: {self.model_name}")
+            logger.info("Loading model: %s", self.model_name)
             try:
                 # Use 4-bit quantization for memory efficiency
                 self.tokenizer = AutoTokenizer.from_pretrained(self.model_name)
@@ -139,21 +179,28 @@ class HuggingFaceLLM(CustomLLM):
                     top_p=0.9,
                     repetition_penalty=1.1,
                 )
-                print("Model loaded successfully!")
+                logger.info("Model loaded successfully!")
             except Exception as e:
-                print(f"Error loading model: {e}")
+                logger.error("Error loading model: %s", e)
                 raise
 
+    def load(self) -> None:
+        """Load the model weights now instead of on the first completion."""
+        self._load_model()
+
+    def _format_prompt(self, prompt: str) -> str:
+        """Wrap the prompt in the instruction format the model expects."""
+        # Format prompt for Mistral
+        if "mistral" in self.model_name.lower():
+            return f"<s>[INST] {prompt} [/INST]"
+        return prompt
+
     @spaces.GPU
     def complete(self, prompt: str, **kwargs: Any) -> CompletionResponse:
         """Complete a prompt using the Hugging Face model with GPU acceleration."""
         self._load_model()
 
-        # Format prompt for Mistral
-        if "mistral" in self.model_name.lower():
-            formatted_prompt = f"<s>[INST] {prompt} [/INST]"
-        else:
-            formatted_prompt = prompt
+        formatted_prompt = self._format_prompt(prompt)
 
         try:
             # Ensure CUDA context is active if using GPU
@@ -164,7 +211,7 @@ class HuggingFaceLLM(CustomLLM):
             with torch.no_grad():
                 outputs = self.pipeline(
                     formatted_prompt,
-                    max_new_tokens=self.max_new_tokens,
+                    max_new_tokens=kwargs.get("max_new_tokens", self.max_new_tokens),
                     temperature=self.temperature,
                     do_sample=True,
                     top_p=0.9,
@@ -183,14 +230,51 @@ class HuggingFaceLLM(CustomLLM):
 
             return CompletionResponse(text=response_text)
         except Exception as e:
-            print(f"Error during generation: {e}")
-            return CompletionResponse(text=f"Error: {str(e)}")
+            logger.error("Error during generation: %s", e)
+            return CompletionResponse(text=f"Error: {str(e)}", additional_kwargs={"error": True})
 
     @spaces.GPU
     def stream_complete(self, prompt: str, **kwargs: Any) -> CompletionResponseGen:
-        """Streaming completion - for now just return the complete response."""
-        response = self.complete(prompt, **kwargs)
-        yield response
+        """Stream a completion, yielding each decoded piece of text as it is generated."""
+        self._load_model()
+
+        formatted_prompt = self._format_prompt(prompt)
+        inputs = self.tokenizer(formatted_prompt, return_tensors="pt").to(self.model.device)
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+
+        def generate():
+            try:
+                with torch.no_grad():
+                    self.model.generate(
+                        **inputs,
+                        streamer=streamer,
+                        max_new_tokens=kwargs.get("max_new_tokens", self.max_new_tokens),
+                        temperature=self.temperature,
+                        do_sample=True,
+                        top_p=0.9,
+                        repetition_penalty=1.1,
+                        pad_token_id=self.tokenizer.eos_token_id
+                    )
+            except Exception as e:
+                errors.append(e)
+                # Unblock the consumer, which would otherwise wait on the streamer forever
+                streamer.end()
+
+        # generate() blocks until the last token, so run it beside the consumer
+        generation = Thread(target=generate)
+        generation.start()
+
+        text = ""
+        for delta in streamer:
+            text += delta
+            yield CompletionResponse(text=text, delta=delta)
+        generation.join()
+
+        if errors:
+            logger.error("Error during generation: %s", errors[0])
+            delta = f"Error: {str(errors[0])}"
+            yield CompletionResponse(text=text + delta, delta=delta, additional_kwargs={"error": True})
 
     @property
     def metadata(self) -> Dict[str, Any]:
@@ -204,111 +288,580 @@ class HuggingFaceLLM(CustomLLM):
         }
 
 
-def setup_settings(config: Optional[ServiceConfig] = None) -> None:
-    """Configure LlamaIndex global settings."""
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    """Scale vectors to unit length so inner products are cosine similarities."""
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+
+class MatrixVectorStore(SimpleVectorStore):
+    """SimpleVectorStore that scores queries with one matrix product.
+
+    Embeddings are still persisted as float lists, so storage stays compatible
+    with SimpleVectorStore. The normalized float32 matrix is built on the first
+    query and rebuilt after the store changes, so a query is a single BLAS
+    matrix-vector product instead of a Python loop. Scores are the same cosine
+    similarities SimpleVectorStore returns.
+    """
+
+    _matrix: Optional[Tuple[List[str], np.ndarray]] = PrivateAttr(default=None)
+
+    def _get_matrix(self) -> Tuple[List[str], np.ndarray]:
+        if self._matrix is None:
+            node_ids = list(self.data.embedding_dict.keys())
+            matrix = np.asarray(list(self.data.embedding_dict.values()), dtype=np.float32)
+            self._matrix = (node_ids, normalize_rows(matrix))
+        return self._matrix
+
+    def add(self, nodes, **add_kwargs: Any) -> List[str]:
+        self._matrix = None
+        return super().add(nodes, **add_kwargs)
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._matrix = None
+        super().delete(ref_doc_id, **delete_kwargs)
+
+    def delete_nodes(self, *args: Any, **kwargs: Any) -> None:
+        self._matrix = None
+        super().delete_nodes(*args, **kwargs)
+
+    def clear(self) -> None:
+        self._matrix = None
+        super().clear()
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Score the query with a matrix product, falling back for filtered/MMR queries."""
+        if (
+            query.mode != VectorStoreQueryMode.DEFAULT
+            or query.filters is not None
+            or query.node_ids is not None
+            or not self.data.embedding_dict
+        ):
+            return super().query(query, **kwargs)
+
+        node_ids, matrix = self._get_matrix()
+        scores = matrix @ normalize_rows(np.asarray(query.query_embedding, dtype=np.float32))
+
+        top_k = min(query.similarity_top_k, len(node_ids))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            similarities=scores[top].tolist(),
+            ids=[node_ids[i] for i in top]
+        )
+
+
+VECTOR_STORE_FILENAME = "default__vector_store.json"
+
+
+def get_embedding_dim() -> int:
+    """Probe the configured embedding model for its output dimension."""
+    return len(Settings.embed_model.get_text_embedding("dimension probe"))
+
+
+# Product quantization learns 2**8 centroids per sub-vector, so it needs at least that many points
+IVFPQ_NBITS = 8
+IVFPQ_MIN_VECTORS = 2 ** IVFPQ_NBITS
+
+
+# Scalar quantizers for ServiceConfig.quantization: 1 or 2 bytes per dimension instead of 4
+SCALAR_QUANTIZER_TYPES = {
+    "sq8": faiss.ScalarQuantizer.QT_8bit,
+    "fp16": faiss.ScalarQuantizer.QT_fp16,
+}
+
+
+def create_hnsw_index(dim: int, config: ServiceConfig) -> faiss.Index:
+    """Create an empty HNSW graph index over the embeddings, scalar-quantized if configured."""
+    # Embeddings are normalized, so inner product ranks and scores like cosine
+    if config.quantization in SCALAR_QUANTIZER_TYPES:
+        qtype = SCALAR_QUANTIZER_TYPES[config.quantization]
+        faiss_index = faiss.IndexHNSWSQ(dim, qtype, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    else:
+        faiss_index = faiss.IndexHNSWFlat(dim, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+    faiss_index.hnsw.efConstruction = config.hnsw_ef_construction
+    faiss_index.hnsw.efSearch = config.hnsw_ef_search
+    return faiss_index
+
+
+def create_ivfpq_index(dim: int, num_vectors: int) -> faiss.Index:
+    """Create an untrained IVF+PQ index sized for num_vectors embeddings."""
+    nlist = max(2 * int(math.sqrt(num_vectors)), 20)
+    # PQ splits each vector into pq_m sub-vectors of 8 dims, which must divide dim evenly
+    pq_m = max(dim // 8, 1)
+    while dim % pq_m:
+        pq_m -= 1
+    quantizer = faiss.IndexFlatIP(dim)
+    faiss_index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, IVFPQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+    faiss_index.nprobe = max(min(nlist // 4, 10), 1)
+    return faiss_index
+
+
+def create_storage_context(config: Optional[ServiceConfig] = None, num_vectors: int = 0) -> StorageContext:
+    """Create the storage context for building a new index of num_vectors embeddings."""
     if config is None:
         config = ServiceConfig()
 
-    # Set up LLM with Hugging Face model
-    Settings.llm = HuggingFaceLLM(
-        model_name=config.model_name,
-        temperature=config.temperature,
-        max_new_tokens=config.num_outputs
+    if config.index_type == "flat" and config.quantization == "none":
+        return StorageContext.from_defaults(vector_store=MatrixVectorStore())
+
+    dim = get_embedding_dim()
+    if config.index_type == "flat":
+        qtype = SCALAR_QUANTIZER_TYPES[config.quantization]
+        faiss_index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+        return StorageContext.from_defaults(vector_store=FaissVectorStore(faiss_index=faiss_index))
+
+    # IVF-PQ codes are already compressed, so quantization only applies to HNSW
+    if config.index_type == "ivfpq" and num_vectors >= IVFPQ_MIN_VECTORS:
+        faiss_index = create_ivfpq_index(dim, num_vectors)
+    else:
+        if config.index_type == "ivfpq":
+            logger.info("Only %d chunks, too few to train IVF-PQ; using HNSW instead", num_vectors)
+        faiss_index = create_hnsw_index(dim, config)
+    return StorageContext.from_defaults(vector_store=FaissVectorStore(faiss_index=faiss_index))
+
+
+DUPLICATE_SOURCES_KEY = "duplicate_sources"
+
+
+def deduplicate_nodes(nodes: List) -> List:
+    """Drop chunks whose normalized text repeats an earlier chunk.
+
+    The kept chunk lists the files its duplicates came from under
+    DUPLICATE_SOURCES_KEY, hidden from both the embedding and the LLM.
+    """
+    unique = {}
+    for node in nodes:
+        normalized = " ".join(node.get_content().lower().split())
+        key = hashlib.blake2b(normalized.encode(), digest_size=16).digest()
+        kept = unique.setdefault(key, node)
+        if kept is node:
+            continue
+        source = node.metadata.get("file_path", node.ref_doc_id)
+        # Chunks may share their metadata containers with the source document, so replace rather than mutate
+        kept.metadata = {**kept.metadata, DUPLICATE_SOURCES_KEY: kept.metadata.get(DUPLICATE_SOURCES_KEY, []) + [source]}
+        if DUPLICATE_SOURCES_KEY not in kept.excluded_embed_metadata_keys:
+            kept.excluded_embed_metadata_keys = kept.excluded_embed_metadata_keys + [DUPLICATE_SOURCES_KEY]
+            kept.excluded_llm_metadata_keys = kept.excluded_llm_metadata_keys + [DUPLICATE_SOURCES_KEY]
+    if len(unique) < len(nodes):
+        logger.info("Skipping %d duplicate chunks", len(nodes) - len(unique))
+    return list(unique.values())
+
+
+def get_embed_target_devices(embed_workers: int) -> List[str]:
+    """Devices for the encoder processes: one per GPU, or embed_workers CPU processes."""
+    if torch.cuda.is_available():
+        # Several workers on one GPU only contend for it
+        return [f"cuda:{i}" for i in range(min(embed_workers, torch.cuda.device_count()))]
+    return ["cpu"] * embed_workers
+
+
+def embed_texts_in_parallel(texts: List[str], embed_workers: int) -> List[List[float]]:
+    """Embed texts with a single pool of encoder processes started for this call."""
+    embed_model = Settings.embed_model
+    # HuggingFaceEmbedding can only start a pool per batch, so drive its
+    # sentence-transformers model directly with one pool for all the texts
+    model = embed_model._model
+    pool = model.start_multi_process_pool(target_devices=get_embed_target_devices(embed_workers))
+    try:
+        embeddings = model.encode_multi_process(
+            texts,
+            pool=pool,
+            batch_size=embed_model.embed_batch_size,
+            prompt_name="text",
+            normalize_embeddings=embed_model.normalize
+        )
+    finally:
+        model.stop_multi_process_pool(pool)
+    return embeddings.tolist()
+
+
+def build_index(documents: List, config: Optional[ServiceConfig] = None) -> VectorStoreIndex:
+    """Chunk and embed documents into a new index backed by the configured vector store."""
+    if config is None:
+        config = ServiceConfig()
+
+    nodes = Settings.node_parser.get_nodes_from_documents(documents, show_progress=True)
+    # Signatures, quoted replies and other boilerplate would otherwise be embedded once per copy
+    nodes = deduplicate_nodes(nodes)
+    storage_context = create_storage_context(config, len(nodes))
+
+    faiss_index = getattr(storage_context.vector_store, "client", None)
+    needs_training = faiss_index is not None and not faiss_index.is_trained
+    # IVF-PQ centroids and codebooks and the 8-bit quantizer's value ranges
+    # are learned from the data, so embed before adding
+    if needs_training or config.embed_workers > 1:
+        texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+        if config.embed_workers > 1:
+            logger.info("Embedding %d chunks across %d workers...", len(texts), config.embed_workers)
+            embeddings = embed_texts_in_parallel(texts, config.embed_workers)
+        else:
+            embeddings = Settings.embed_model.get_text_embedding_batch(texts, show_progress=True)
+        for node, embedding in zip(nodes, embeddings):
+            node.embedding = embedding
+
+    if needs_training:
+        logger.info("Training FAISS index on %d embeddings...", len(nodes))
+        faiss_index.train(np.asarray(embeddings, dtype=np.float32))
+
+    # Nodes that already carry an embedding are not embedded again
+    return VectorStoreIndex(nodes, storage_context=storage_context, show_progress=True)
+
+
+def is_faiss_storage(storage_directory: str) -> bool:
+    """Check whether the persisted vector store is a binary FAISS index rather than JSON."""
+    try:
+        with open(Path(storage_directory) / VECTOR_STORE_FILENAME, 'rb') as f:
+            return f.read(1) != b"{"
+    except FileNotFoundError:
+        return False
+
+
+def read_faiss_index(path: Path) -> faiss.Index:
+    """Read a persisted FAISS index, memory-mapping it where the index type allows."""
+    try:
+        # Pages are read on first access and can be reclaimed under memory pressure
+        return faiss.read_index(str(path), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Not every index type can be read memory-mapped
+        return faiss.read_index(str(path))
+
+
+STORAGE_ARCHIVE_FILENAME = "storage.tar"
+# Only the files written by LlamaIndex; our own caches live alongside them
+STORE_FILES_GLOB = "*store.json"
+
+
+def persist_index(index: VectorStoreIndex, storage_directory: str = "./storage", config: Optional[ServiceConfig] = None) -> None:
+    """Persist the index as separate store files, or as a single tar archive when configured."""
+    if config is None:
+        config = ServiceConfig()
+
+    storage_path = Path(storage_directory)
+    if config.storage_format == "directory":
+        index.storage_context.persist(persist_dir=storage_directory)
+        (storage_path / STORAGE_ARCHIVE_FILENAME).unlink(missing_ok=True)
+        return
+
+    # One archive is a single file to create and sync instead of one per store
+    storage_path.mkdir(parents=True, exist_ok=True)
+    tmp_archive_path = storage_path / f"{STORAGE_ARCHIVE_FILENAME}.{os.getpid()}.tmp"
+    with tempfile.TemporaryDirectory() as persist_directory:
+        index.storage_context.persist(persist_dir=persist_directory)
+        with tarfile.open(tmp_archive_path, "w") as archive:
+            archive.add(persist_directory, arcname=".")
+    os.replace(tmp_archive_path, storage_path / STORAGE_ARCHIVE_FILENAME)
+    # Loose store files from an earlier directory-format persist would be stale now
+    for store_file in storage_path.glob(STORE_FILES_GLOB):
+        store_file.unlink()
+
+
+def load_storage_context(storage_directory: str, config: Optional[ServiceConfig] = None) -> StorageContext:
+    """Load a persisted storage context from a store directory or storage archive."""
+    archive_path = Path(storage_directory) / STORAGE_ARCHIVE_FILENAME
+    if not archive_path.exists():
+        return load_storage_directory(storage_directory, config)
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as extract_directory:
+        with tarfile.open(archive_path) as archive:
+            # The data filter (Python 3.11.4+) refuses absolute paths and links out of the directory
+            filter_kwargs = {"filter": "data"} if hasattr(tarfile, "data_filter") else {}
+            archive.extractall(extract_directory, **filter_kwargs)
+        # Every store is read into memory here, and a mapped FAISS index outlives
+        # the unlink of its file, so the extracted copy can be removed right away
+        return load_storage_directory(extract_directory, config)
+
+
+def load_storage_directory(storage_directory: str, config: Optional[ServiceConfig] = None) -> StorageContext:
+    """Load a storage context with whichever vector store it was built with."""
+    if config is None:
+        config = ServiceConfig()
+
+    if is_faiss_storage(storage_directory):
+        vector_store = FaissVectorStore(faiss_index=read_faiss_index(Path(storage_directory) / VECTOR_STORE_FILENAME))
+        # Override the persisted efSearch so it can be tuned without rebuilding
+        if hasattr(vector_store.client, "hnsw"):
+            vector_store.client.hnsw.efSearch = config.hnsw_ef_search
+    else:
+        # JSON stores hold float embeddings and score exactly whatever the
+        # quantization setting; sq8 and fp16 codes only exist in FAISS indexes
+        vector_store = MatrixVectorStore.from_persist_dir(storage_directory)
+    return StorageContext.from_defaults(persist_dir=storage_directory, vector_store=vector_store)
+
+
+# One LLM at a time: a cached model keeps its weights in memory once loaded
+@lru_cache(maxsize=1)
+def _build_llm(model_name: str, temperature: float, max_new_tokens: int) -> HuggingFaceLLM:
+    """Build the LLM, reusing the instance (and its loaded weights) for the same parameters."""
+    return HuggingFaceLLM(
+        model_name=model_name,
+        temperature=temperature,
+        max_new_tokens=max_new_tokens
     )
 
-    # Set up embedding model with sentence transformers
-    Settings.embed_model = HuggingFaceEmbedding(
+
+@lru_cache(maxsize=4)
+def _build_embed_model(device: str, embed_batch_size: int) -> HuggingFaceEmbedding:
+    """Build the embedding model, reusing the instance for the same parameters."""
+    # Large batches keep the device busy when embedding chunks from many files
+    return HuggingFaceEmbedding(
         model_name="sentence-transformers/all-MiniLM-L6-v2",
-        device=get_device()
+        device=device,
+        embed_batch_size=embed_batch_size
     )
 
+
+# Fingerprint of the config the global settings were last built from
+_SETTINGS_FINGERPRINT: Optional[str] = None
+
+
+def setup_settings(config: Optional[ServiceConfig] = None) -> None:
+    """Configure LlamaIndex global settings, unless they were already built from an equal config."""
+    global _SETTINGS_FINGERPRINT
+    if config is None:
+        config = ServiceConfig()
+
+    fingerprint = hashlib.blake2b(config.model_dump_json().encode(), digest_size=8).hexdigest()
+    if fingerprint == _SETTINGS_FINGERPRINT:
+        return
+
+    # Set up LLM with Hugging Face model
+    Settings.llm = _build_llm(config.model_name, config.temperature, config.num_outputs)
+
+    # Set up embedding model with sentence transformers
+    Settings.embed_model = _build_embed_model(get_device(), config.embed_batch_size)
+
     # Set chunk size
     Settings.chunk_size = config.chunk_size_limit
     Settings.chunk_overlap = config.max_chunk_overlap
+    _SETTINGS_FINGERPRINT = fingerprint
+
+
+# Defaults shared by the indexer and the chatbot so the two cannot drift apart
+DEFAULT_RETRIEVAL_CONFIG = {
+    "similarity_threshold": 0.7,
+    "max_chunks": 5,
+    "context_history_length": 3
+}
+
+# Used when the LLM analysis fails or returns something that isn't JSON
+DEFAULT_ANALYSIS = {
+    "name": "Assistant",
+    "description": "AI chatbot based on provided documents and communication style",
+    "title": "Personal AI Assistant",
+    "questions": ["Tell me about yourself", "What are your interests?", "How do you think?"]
+}
+
+
+ANALYSIS_CACHE_DIRECTORY = Path(".cache")
+
+
+def is_valid_analysis(analysis) -> bool:
+    """Check that a parsed analysis has every field the config update reads."""
+    return (
+        isinstance(analysis, dict)
+        and all(isinstance(analysis.get(key), str) for key in ("name", "description", "title"))
+        and isinstance(analysis.get("questions"), list)
+        and all(isinstance(question, str) for question in analysis["questions"])
+    )
+
+# The outermost {...} in a reply, ignoring any prose or ```json fence around it
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
+
+
+def get_analysis_cache_path(sample_content: str, llm) -> Path:
+    """Cache file for the analysis of this content by this model."""
+    model_name = getattr(llm, "model_name", type(llm).__name__)
+    key = hashlib.blake2b(f"{model_name}\n{sample_content}".encode(), digest_size=16).hexdigest()
+    return ANALYSIS_CACHE_DIRECTORY / f"analysis_{key}.json"
+
+
+def write_json_atomic(path: Path, data) -> None:
+    """Write JSON through a temporary file so readers never see a partial file."""
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Could not write %s: %s", path, e)
 
 
 def analyze_documents_for_config(documents: List, llm) -> dict:
     """Analyze documents to generate config updates including name, description, and questions."""
     # Sample documents to analyze
-    sample_docs = documents[:5] if len(documents) >= 5 else documents
-    sample_content = "\n\n".join([doc.text[:800] for doc in sample_docs])
+    sample_content = "\n\n".join(doc.text[:800] for doc in documents[:5])
     
-    prompt = f"""Analyze this personal writing/document content and extract information about the person:
-
-Content:
-{sample_content}
-
-Based on this content, provide:
-1. The person's name (if mentioned, otherwise use "Assistant")
-2. A brief description of who they are (2-3 sentences)
-3. A good title for a chatbot representing them
-4. 5 specific questions someone might ask this person based on the content
-
-Format your response as JSON:
-{{
-  "name": "Person's Name",
-  "description": "Brief description of the person",
-  "title": "Chatbot Title",
-  "questions": [
-    "Question 1",
-    "Question 2", 
-    "Question 3",
-    "Question 4",
-    "Question 5"
-  ]
-}}"""
+    prompt = CONFIG_ANALYSIS_PROMPT.format(content=sample_content)
+
+    # Re-indexing unchanged documents with the same model would ask the same question again
+    cache_path = get_analysis_cache_path(sample_content, llm)
+    try:
+        analysis = orjson.loads(cache_path.read_bytes())
+        # Entries written before analyses were validated may be partial
+        if is_valid_analysis(analysis):
+            logger.info("Using cached document analysis from %s", cache_path)
+            return analysis
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        pass
 
     try:
         response = llm.complete(prompt)
-        # Try to parse JSON response
+        # Try to parse the JSON object in the response
+        match = _JSON_OBJECT_RE.search(response.text)
         try:
-            return json.loads(response.text)
-        except json.JSONDecodeError:
-            # Fallback if JSON parsing fails
-            return {
-                "name": "Assistant",
-                "description": "AI chatbot based on provided documents and communication style",
-                "title": "Personal AI Assistant",
-                "questions": ["Tell me about yourself", "What are your interests?", "How do you think?"]
-            }
+            # orjson decodes str directly, so the reply is never re-encoded to bytes
+            analysis = orjson.loads(match.group(0)) if match else None
+        except orjson.JSONDecodeError:
+            analysis = None
+        if not is_valid_analysis(analysis):
+            # Fallback if JSON parsing fails or fields are missing
+            return dict(DEFAULT_ANALYSIS)
+        write_json_atomic(cache_path, analysis)
+        return analysis
     except Exception as e:
-        print(f"Error analyzing documents: {e}")
-        return {
-            "name": "Assistant", 
-            "description": "AI chatbot based on provided documents and communication style",
-            "title": "Personal AI Assistant",
-            "questions": ["Tell me about yourself", "What are your interests?", "How do you think?"]
-        }
+        logger.error("Error analyzing documents: %s", e)
+        return dict(DEFAULT_ANALYSIS)
+
+
+TOPIC_SEED_QUERY = "life experiences interests work relationships music travel school"
+TOPIC_SEED_IDS_FILENAME = "topic_seed_ids.json"
+
+
+def save_topic_seed_ids(index: VectorStoreIndex, storage_directory: str = "./storage") -> None:
+    """Store the nodes matching the topic query so the chatbot can skip that retrieval."""
+    seed_ids_path = Path(storage_directory) / TOPIC_SEED_IDS_FILENAME
+    try:
+        nodes = index.as_retriever(similarity_top_k=10).retrieve(TOPIC_SEED_QUERY)
+        seed_ids_path.write_bytes(orjson.dumps([node.node.node_id for node in nodes]))
+    except Exception as e:
+        logger.warning("Could not save topic seed nodes: %s", e)
+        # Ids saved for the previous index would point at nodes that are gone
+        seed_ids_path.unlink(missing_ok=True)
+
+
+def load_topic_seed_ids(storage_directory: str = "./storage") -> Optional[List[str]]:
+    """Load the node ids saved by save_topic_seed_ids, if present."""
+    try:
+        return orjson.loads((Path(storage_directory) / TOPIC_SEED_IDS_FILENAME).read_bytes())
+    except (FileNotFoundError, orjson.JSONDecodeError):
+        return None
+
+
+# Pool workers are spawned and re-import the entry module (torch, transformers,
+# faiss), which costs seconds each, so parallel parsing only pays off on large
+# corpora or on many files in formats that are slow to parse
+PARALLEL_LOAD_MIN_BYTES = 64 * 1024 * 1024
+PARALLEL_LOAD_MIN_SLOW_FILES = 16
+SLOW_PARSE_SUFFIXES = {".pdf", ".docx", ".pptx", ".epub", ".hwp", ".ipynb"}
+MAX_LOAD_WORKERS = 8
+
+
+def load_documents(directory_path: str) -> List:
+    """Load documents from a directory, parsing files across processes for large corpora."""
+    reader = SimpleDirectoryReader(directory_path)
+    input_files = [Path(f) for f in reader.input_files]
+    total_bytes = sum(f.stat().st_size for f in input_files)
+    slow_files = sum(1 for f in input_files if f.suffix.lower() in SLOW_PARSE_SUFFIXES)
+    if total_bytes < PARALLEL_LOAD_MIN_BYTES and slow_files < PARALLEL_LOAD_MIN_SLOW_FILES:
+        return reader.load_data()
+    # Capped to bound the number of files held open at once
+    return reader.load_data(num_workers=min(os.cpu_count() or 1, MAX_LOAD_WORKERS, len(input_files)))
 
 
 def construct_index(directory_path: str, config: Optional[ServiceConfig] = None) -> VectorStoreIndex:
     """Construct a vector index from documents in the specified directory."""
     try:
-        documents = SimpleDirectoryReader(directory_path).load_data()
+        documents = load_documents(directory_path)
         setup_settings(config)
-        index = VectorStoreIndex.from_documents(documents)
-        index.storage_context.persist()
+        index = build_index(documents, config)
+        persist_index(index, config=config)
+        save_topic_seed_ids(index)
         return index
     except Exception as e:
-        print(f"Error constructing index: {str(e)}")
+        logger.error("Error constructing index: %s", e)
         raise
 
 
-def load_or_create_index(storage_directory: str = "./storage", docs_directory: str = "docs") -> VectorStoreIndex:
+# Loaded indexes are reused until they expire or the storage on disk changes
+INDEX_CACHE_TTL = 300
+_INDEX_CACHE: Dict[str, Tuple[float, float, VectorStoreIndex]] = {}
+
+
+def get_storage_mtime(storage_directory: str) -> float:
+    """Latest modification time of the store files LlamaIndex persisted in storage_directory."""
+    storage_path = Path(storage_directory)
+    store_files = [*storage_path.glob(STORE_FILES_GLOB), *storage_path.glob(STORAGE_ARCHIVE_FILENAME)]
+    return max((f.stat().st_mtime for f in store_files), default=0)
+
+
+def clear_index_cache() -> None:
+    """Drop all indexes cached by load_or_create_index."""
+    _INDEX_CACHE.clear()
+
+
+def load_or_create_index(
+    storage_directory: str = "./storage",
+    docs_directory: str = "docs",
+    config: Optional[ServiceConfig] = None
+) -> VectorStoreIndex:
     """Load index from storage or create new one if not found."""
     storage_path = Path(storage_directory)
-    
+    cache_key = str(storage_path.resolve())
+    storage_mtime = get_storage_mtime(storage_directory)
+
+    cached = _INDEX_CACHE.get(cache_key)
+    if cached is not None:
+        cached_at, cached_mtime, index = cached
+        if time.time() - cached_at < INDEX_CACHE_TTL and cached_mtime == storage_mtime:
+            return index
+
+    index = None
     if storage_path.exists():
         try:
-            print(f"Loading existing index from {storage_directory}")
-            storage_context = StorageContext.from_defaults(persist_dir=storage_directory)
-            return load_index_from_storage(storage_context)
+            logger.info("Loading existing index from %s", storage_directory)
+            storage_context = load_storage_context(storage_directory, config)
+            index = load_index_from_storage(storage_context)
         except Exception as e:
-            print(f"Failed to load index: {e}. Creating new index...")
+            logger.warning("Failed to load index: %s. Creating new index...", e)
     
-    # Fallback to creating new index
-    print(f"Creating new index from documents in {docs_directory}...")
-    return construct_index(docs_directory)
+    if index is None:
+        # Fallback to creating new index
+        logger.info("Creating new index from documents in %s...", docs_directory)
+        index = construct_index(docs_directory, config)
+        storage_mtime = get_storage_mtime(storage_directory)
+
+    _INDEX_CACHE[cache_key] = (time.time(), storage_mtime, index)
+    return index
+
+
+# Linux FICLONE ioctl: make the destination share the source's extents copy-on-write
+FICLONE = 0x40049409
+
+
+def clone_file(src: Path, dst: Path) -> None:
+    """Copy a file as a reflink clone where the filesystem supports it, else byte by byte."""
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+                fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+            shutil.copystat(src, dst)
+            return
+        except OSError:
+            # EXDEV, EOPNOTSUPP, ENOTTY, ...: not a reflink-capable filesystem pair
+            pass
+    shutil.copy2(src, dst)
+
+
+def clone_tree(src: Path, dst: Path) -> None:
+    """Recursively copy a directory tree, cloning each file with clone_file."""
+    dst.mkdir(parents=True)
+    with os.scandir(src) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                clone_tree(Path(entry.path), dst / entry.name)
+            else:
+                clone_file(Path(entry.path), dst / entry.name)
+    shutil.copystat(src, dst)
 
 
 def setup_initial_files(docs_directory: str, storage_directory: str = "./storage") -> None:
@@ -323,24 +876,51 @@ def setup_initial_files(docs_directory: str, storage_directory: str = "./storage
     
     # Copy sample config if config.json doesn't exist
     if not config_path.exists() and sample_config_path.exists():
-        print(f"Copying sample config to config.json...")
-        shutil.copy2(sample_config_path, config_path)
-        print("Created config.json from sample")
+        logger.info("Copying sample config to config.json...")
+        clone_file(sample_config_path, config_path)
+        logger.info("Created config.json from sample")
     
     # Copy sample docs if docs directory doesn't exist
     if not docs_path.exists() and sample_docs_path.exists():
-        print(f"Copying sample docs to {docs_directory}...")
-        shutil.copytree(sample_docs_path, docs_path)
-        print(f"Created {docs_directory} directory from sample")
+        logger.info("Copying sample docs to %s...", docs_directory)
+        clone_tree(sample_docs_path, docs_path)
+        logger.info("Created %s directory from sample", docs_directory)
     
     # Copy sample storage if storage directory doesn't exist
     if not storage_path.exists() and sample_storage_path.exists():
-        print(f"Copying sample storage to {storage_directory}...")
-        shutil.copytree(sample_storage_path, storage_path)
-        print(f"Created {storage_directory} directory from sample")
+        logger.info("Copying sample storage to %s...", storage_directory)
+        clone_tree(sample_storage_path, storage_path)
+        logger.info("Created %s directory from sample", storage_directory)
 
 
-def index_documents(
+def encode_embedding(embedding) -> str:
+    """Pack an embedding into a hex string of float16 values for storing in config.json."""
+    return np.asarray(embedding, dtype=np.float16).tobytes().hex()
+
+
+def decode_embedding(encoded: str) -> np.ndarray:
+    """Unpack an embedding stored by encode_embedding."""
+    return np.frombuffer(bytes.fromhex(encoded), dtype=np.float16).astype(np.float32)
+
+
+def embed_questions(questions: List[str]) -> Dict[str, str]:
+    """Embed the example questions as the chatbot would embed them, keyed by question for config.json."""
+    # Query embeddings, not text embeddings: some models prefix queries with an instruction
+    return {question: encode_embedding(Settings.embed_model.get_query_embedding(question)) for question in questions}
+
+
+def log_analysis(action: str, analysis: dict) -> None:
+    """Log the name, title, description and questions written to the config."""
+    logger.info("%s:", action)
+    logger.info("  Name: %s", analysis["name"])
+    logger.info("  Title: %s", analysis["title"])
+    logger.info("  Description: %s", analysis["description"])
+    logger.info("  Generated %d questions:", len(analysis["questions"]))
+    for i, q in enumerate(analysis["questions"], 1):
+        logger.info("    %d. %s", i, q)
+
+
+async def aindex_documents(
     docs_directory: str,
     storage_directory: str = "./storage",
     service_config: Optional[ServiceConfig] = None,
@@ -348,7 +928,7 @@ def index_documents(
     generate_questions: bool = True
 ) -> VectorStoreIndex:
     """
-    Index documents from a directory and persist to storage.
+    Index documents from a directory and persist to storage, without blocking the event loop.
     
     Args:
         docs_directory: Directory containing documents to index
@@ -361,7 +941,7 @@ def index_documents(
         VectorStoreIndex: The created or loaded index
     """
     # Set up initial files from samples if needed
-    setup_initial_files(docs_directory, storage_directory)
+    await asyncio.to_thread(setup_initial_files, docs_directory, storage_directory)
     
     docs_path = Path(docs_directory)
     storage_path = Path(storage_directory)
@@ -372,41 +952,46 @@ def index_documents(
     
     # Check if we should load existing index
     if storage_path.exists() and not force_reindex:
-        print(f"Loading existing index from {storage_directory}")
+        logger.info("Loading existing index from %s", storage_directory)
         try:
-            storage_context = StorageContext.from_defaults(persist_dir=storage_directory)
-            index = load_index_from_storage(storage_context)
+            storage_context = await asyncio.to_thread(load_storage_context, storage_directory, service_config)
+            index = await asyncio.to_thread(load_index_from_storage, storage_context)
             return index
         except Exception as e:
-            print(f"Failed to load existing index: {e}")
-            print("Creating new index...")
+            logger.warning("Failed to load existing index: %s", e)
+            logger.info("Creating new index...")
     
     # Create storage directory if it doesn't exist
     storage_path.mkdir(parents=True, exist_ok=True)
     
     # Load documents
-    print(f"Loading documents from {docs_directory}")
-    documents = SimpleDirectoryReader(docs_directory).load_data()
-    print(f"Loaded {len(documents)} documents")
+    logger.info("Loading documents from %s", docs_directory)
+    documents = await asyncio.to_thread(load_documents, docs_directory)
+    logger.info("Loaded %d documents", len(documents))
     
     # Set up global settings
-    setup_settings(service_config)
+    await asyncio.to_thread(setup_settings, service_config)
     
     # Create index
-    print("Creating vector index...")
-    index = VectorStoreIndex.from_documents(documents)
+    logger.info("Creating vector index...")
+    index = await asyncio.to_thread(build_index, documents, service_config)
     
     # Generate config updates if requested
     if generate_questions:
-        print("Analyzing documents to update configuration...")
-        analysis = analyze_documents_for_config(documents, Settings.llm)
+        logger.info("Analyzing documents to update configuration...")
+        analysis = await asyncio.to_thread(analyze_documents_for_config, documents, Settings.llm)
+        try:
+            example_embeddings = await asyncio.to_thread(embed_questions, analysis["questions"])
+        except Exception as e:
+            # Without stored embeddings the chatbot embeds the examples when they are asked
+            logger.error("Error embedding example questions: %s", e)
+            example_embeddings = {}
         
         # Update config.json with analyzed information
         config_path = Path("config.json")
         if config_path.exists():
             try:
-                with open(config_path, 'r') as f:
-                    config = json.load(f)
+                config = orjson.loads(config_path.read_bytes())
                 
                 # Update person info
                 config["person"]["name"] = analysis["name"]
@@ -415,22 +1000,16 @@ def index_documents(
                 # Update chatbot info
                 config["chatbot"]["title"] = analysis["title"]
                 config["chatbot"]["examples"] = analysis["questions"]
+                config["chatbot"]["example_embeddings"] = example_embeddings
                 
-                with open(config_path, 'w') as f:
-                    json.dump(config, f, indent=2)
+                config_path.write_bytes(orjson.dumps(config, option=orjson.OPT_INDENT_2))
                 
-                print(f"Updated config.json:")
-                print(f"  Name: {analysis['name']}")
-                print(f"  Title: {analysis['title']}")
-                print(f"  Description: {analysis['description']}")
-                print(f"  Generated {len(analysis['questions'])} questions:")
-                for i, q in enumerate(analysis['questions'], 1):
-                    print(f"    {i}. {q}")
+                log_analysis("Updated config.json", analysis)
             except Exception as e:
-                print(f"Error updating config.json: {e}")
+                logger.error("Error updating config.json: %s", e)
         else:
             # Create new config.json file
-            print("Creating new config.json file...")
+            logger.info("Creating new config.json file...")
             default_config = {
                 "person": {
                     "name": analysis["name"],
@@ -440,32 +1019,40 @@ def index_documents(
                 "chatbot": {
                     "title": analysis["title"],
                     "description": analysis["description"],
-                    "examples": analysis["questions"]
+                    "examples": analysis["questions"],
+                    "example_embeddings": example_embeddings
                 },
-                "retrieval": {
-                    "similarity_threshold": 0.7,
-                    "max_chunks": 5,
-                    "context_history_length": 3
-                }
+                "retrieval": dict(DEFAULT_RETRIEVAL_CONFIG)
             }
             
             try:
-                with open(config_path, 'w') as f:
-                    json.dump(default_config, f, indent=2)
+                config_path.write_bytes(orjson.dumps(default_config, option=orjson.OPT_INDENT_2))
                 
-                print(f"Created config.json:")
-                print(f"  Name: {analysis['name']}")
-                print(f"  Title: {analysis['title']}")
-                print(f"  Description: {analysis['description']}")
-                print(f"  Generated {len(analysis['questions'])} questions:")
-                for i, q in enumerate(analysis['questions'], 1):
-                    print(f"    {i}. {q}")
+                log_analysis("Created config.json", analysis)
             except Exception as e:
-                print(f"Error creating config.json: {e}")
+                logger.error("Error creating config.json: %s", e)
 
     # Persist index
-    print(f"Persisting index to {storage_directory}")
-    index.storage_context.persist(persist_dir=storage_directory)
+    logger.info("Persisting index to %s", storage_directory)
+    await asyncio.to_thread(persist_index, index, storage_directory, service_config)
+    await asyncio.to_thread(save_topic_seed_ids, index, storage_directory)
     
-    print("Indexing completed successfully!")
-    return index
\ No newline at end of file
+    logger.info("Indexing completed successfully!")
+    return index
+
+
+def index_documents(
+    docs_directory: str,
+    storage_directory: str = "./storage",
+    service_config: Optional[ServiceConfig] = None,
+    force_reindex: bool = False,
+    generate_questions: bool = True
+) -> VectorStoreIndex:
+    """Index documents from a directory and persist to storage; see aindex_documents."""
+    return asyncio.run(aindex_documents(
+        docs_directory,
+        storage_directory=storage_directory,
+        service_config=service_config,
+        force_reindex=force_reindex,
+        generate_questions=generate_questions
+    ))
\ No newline at end of file
@@ -18,6 +18,31 @@ Hobbies
 
 Just single words, nothing else."""
 
+CONFIG_ANALYSIS_PROMPT = """Analyze this personal writing/document content and extract information about the person:
+
+Content:
+{content}
+
+Based on this content, provide:
+1. The person's name (if mentioned, otherwise use "Assistant")
+2. A brief description of who they are (2-3 sentences)
+3. A good title for a chatbot representing them
+4. 5 specific questions someone might ask this person based on the content
+
+Format your response as JSON:
+{{
+  "name": "Person's Name",
+  "description": "Brief description of the person",
+  "title": "Chatbot Title",
+  "questions": [
+    "Question 1",
+    "Question 2", 
+    "Question 3",
+    "Question 4",
+    "Question 5"
+  ]
+}}"""
+
 CHATBOT_TOPIC_RESPONSE_PROMPT = """Tell me about {topic_word}."""
 
 CHATBOT_RESPONSE_PROMPT = """You are this person speaking from their own memories and experiences. Study the provided personal documents carefully to understand:
@@ -76,23 +76,29 @@ if [ ! -d "$STORAGE_DIR" ]; then
 else
     echo "✅ Storage directory already exists"
 
-    # Optional: Check if any files are missing and copy them
-    echo "Checking for missing files..."
-    MISSING_FILES=false
-
-    for file in "$SAMPLE_STORAGE_DIR"/*; do
-        filename=$(basename "$file")
-        if [ ! -f "$STORAGE_DIR/$filename" ]; then
-            echo "Missing file: $filename - copying..."
-            cp "$file" "$STORAGE_DIR"/
-            MISSING_FILES=true
-        fi
-    done
-
-    if [ "$MISSING_FILES" = true ]; then
-        echo "✅ Copied missing files"
+    # A tar-format index keeps its stores inside storage.tar; copying the
+    # sample store files next to it would only leave stale stores behind
+    if [ -f "$STORAGE_DIR/storage.tar" ]; then
+        echo "✅ Storage archive found, skipping missing file check"
     else
-        echo "✅ All required files are present"
+        # Optional: Check if any files are missing and copy them
+        echo "Checking for missing files..."
+        MISSING_FILES=false
+
+        for file in "$SAMPLE_STORAGE_DIR"/*; do
+            filename=$(basename "$file")
+            if [ ! -f "$STORAGE_DIR/$filename" ]; then
+                echo "Missing file: $filename - copying..."
+                cp "$file" "$STORAGE_DIR"/
+                MISSING_FILES=true
+            fi
+        done
+
+        if [ "$MISSING_FILES" = true ]; then
+            echo "✅ Copied missing files"
+        else
+            echo "✅ All required files are present"
+        fi
     fi
 fi
 